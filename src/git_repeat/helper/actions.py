@@ -13,12 +13,28 @@
 
 from __future__ import annotations
 
+import os
 import sys
+import glob
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from git import Repo, Commit
 from git.exc import InvalidGitRepositoryError
-from .differences import update_repository, diff_to_data, data_check_files_exist, data_to_recipe, recipe_to_data
+from .differences import update_repository, update_file, iter_diff_data, diff_to_data, data_check_files_exist, data_to_recipe, \
+    recipe_to_data, compile_path_filter, diff_commits, colliding_paths
+from .ledger import content_hash, ledger_open, ledger_save, ledger_is_complete, ledger_set_complete
+
+RUN_WORKERS = 4
+
+# recipes hold decoded text, independent of the encodings of the files they were made from
+RECIPE_ENCODING = 'utf-8-sig'
+
+
+class _RepoLogger(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[{self.extra['repo']}] {msg}", kwargs
 
 
 def _get_git_repo(repo_path, rev_from, rev_to) -> (Repo, Commit, Commit):
@@ -55,19 +71,81 @@ def run(rev_from, rev_to, repo_path, replacements, encoding, exclude, include, d
     exclude = json.loads(exclude)
     include = json.loads(include)
 
-    diffs = commit_from.diff(commit_to)
-    data = diff_to_data(diffs, replacements.keys(), encoding, exclude, include, version)
+    path_filter = compile_path_filter(exclude, include)
 
     if isinstance(replacements, list):
         logging.getLogger("git-repeat").info(f"Multiple replacements provided")
+    else:
+        replacements = [replacements]
+
+    ledger = ledger_open(repo.working_dir, content_hash([commit_from.hexsha, commit_to.hexsha, exclude, include, encoding]))
+    replacements_hashes = [content_hash(r) for r in replacements]
+    if ledger_is_complete(ledger, replacements_hashes):
+        logging.getLogger("git-repeat").info(f"Already applied with these replacements, nothing to do")
+        return
 
-        counter = 1
+    diffs = diff_commits(commit_from, commit_to, exclude, include)
+    colliding = colliding_paths(diffs, path_filter, replacements)
+    deferred = []
+
+    def independent():
+        for item in iter_diff_data(diffs, encoding, path_filter):
+            if item[1] in colliding:
+                deferred.append(item)
+            else:
+                yield item
+
+    try:
+        ledger_set_complete(ledger, replacements_hashes, False)
+
+        # independent files are applied with all replacements as soon as their diff is known
+        _run_pipeline(independent(), repo.working_dir, encoding, dry_run, replacements, ledger)
+
+        # files sharing paths keep the order of update_repository, copies before changes for each replacement set
         for r in replacements:
-            logging.getLogger("git-repeat").info(f"Run #{counter}")
-            update_repository(repo.working_dir, encoding, dry_run, r, data)
-            counter += 1
-    else:
-        update_repository(repo.working_dir, encoding, dry_run, replacements, data)
+            for kind in ['copies', 'changes']:
+                for item_kind, path, changes in deferred:
+                    if item_kind == kind:
+                        update_file(repo.working_dir, encoding, dry_run, r, kind, path, changes, ledger)
+
+        ledger_set_complete(ledger, replacements_hashes, True)
+    finally:
+        if not dry_run:
+            ledger_save(ledger)
+
+
+def _run_pipeline(items, repo_path, encoding, dry_run, replacements, ledger, workers=RUN_WORKERS):
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    failures = []
+    futures = []
+
+    def done(future):
+        if future.exception() is not None:
+            failures.append(future.exception())
+        in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for kind, path, changes in items:
+            in_flight.acquire()
+            if len(failures) > 0:
+                in_flight.release()
+                break
+
+            future = executor.submit(_update_file_runs, repo_path, encoding, dry_run, replacements, kind, path, changes, ledger)
+            future.add_done_callback(done)
+            futures.append(future)
+
+    for future in futures:
+        future.result()
+
+
+def _update_file_runs(repo_path, encoding, dry_run, replacements, kind, path, changes, ledger):
+    counter = 1
+    for r in replacements:
+        if len(replacements) > 1:
+            logging.getLogger("git-repeat").debug(f"Run #{counter} for {path}")
+        update_file(repo_path, encoding, dry_run, r, kind, path, changes, ledger)
+        counter += 1
 
 
 def recipe(rev_from, rev_to, repo_path, keys, out_path, encoding, exclude, include, version):
@@ -80,19 +158,36 @@ def recipe(rev_from, rev_to, repo_path, keys, out_path, encoding, exclude, inclu
     exclude = json.loads(exclude)
     include = json.loads(include)
 
-    diffs = commit_from.diff(commit_to)
+    path_filter = compile_path_filter(exclude, include)
+    diffs = diff_commits(commit_from, commit_to, exclude, include)
 
-    data = diff_to_data(diffs, keys, encoding, exclude, include, version)
-    output = data_to_recipe(repo, commit_from, commit_to, diffs, exclude, include, data)
+    data = diff_to_data(diffs, keys, encoding, path_filter, version)
+    output = data_to_recipe(repo, commit_from, commit_to, diffs, path_filter, data)
 
     if out_path == '-':
         print(output, end='')
     else:
-        with open(out_path, mode="w", encoding=encoding) as of:
+        with open(out_path, mode="w", encoding=RECIPE_ENCODING, newline='') as of:
             of.write(output)
 
 
-def apply(repo_path, replacements, in_path, encoding, dry_run):
+def _read_recipe(in_path, encoding) -> str:
+    if in_path == '-':
+        raw = sys.stdin.buffer.read()
+    else:
+        with open(in_path, mode='rb') as ir:
+            raw = ir.read()
+
+    # newlines are kept as they are, recipes contain file contents with their original line endings
+    try:
+        return raw.decode(RECIPE_ENCODING)
+    except UnicodeDecodeError:
+        # recipes of older versions were stored in the encoding of the files
+        logging.getLogger("git-repeat").warning(f"Recipe is not valid UTF-8, reading it as {encoding}")
+        return raw.decode(encoding)
+
+
+def apply(repo_paths, replacements, in_path, encoding, dry_run, jobs=RUN_WORKERS):
     if dry_run:
         logging.getLogger("git-repeat").info(f"Dry-run enabled")
 
@@ -102,29 +197,86 @@ def apply(repo_path, replacements, in_path, encoding, dry_run):
 
     replacements = json.loads(replacements)
 
-    recipe_str = ""
-    if in_path == '-':
-        for line in sys.stdin:
-            recipe_str += line
-    else:
-        with open(in_path, mode='r', encoding=encoding) as ir:
-            recipe_str = ir.read()
+    data = recipe_to_data(_read_recipe(in_path, encoding))
+    recipe_hash = content_hash([data, encoding])
+    repo_paths = _expand_repo_paths(repo_paths)
 
-    data = recipe_to_data(recipe_str)
-    data_check_files_exist(repo_path, data)
+    if len(repo_paths) == 1:
+        _apply_repository(repo_paths[0], data, recipe_hash, replacements, encoding, dry_run, True, logging.getLogger("git-repeat"))
+        return
 
-    if isinstance(replacements, list):
-        logging.getLogger("git-repeat").info(f"Multiple replacements provided")
+    # recipe is parsed once, keys only need to be checked once for all repositories
+    for r in replacements if isinstance(replacements, list) else [replacements]:
+        _check_keys_replacements(data['keys'], r)
 
-        counter = 1
-        for r in replacements:
-            logging.getLogger("git-repeat").info(f"Run #{counter}")
-            _check_keys_replacements(data['keys'], r)
-            update_repository(repo_path, encoding, dry_run, r, data)
-            counter += 1
-    else:
-        _check_keys_replacements(data['keys'], replacements)
-        update_repository(repo_path, encoding, dry_run, replacements, data)
+    logging.getLogger("git-repeat").info(f"Applying recipe to {len(repo_paths)} repositories")
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {repo_path: executor.submit(_apply_repository, repo_path, data, recipe_hash, replacements, encoding, dry_run, False,
+                                              _RepoLogger(logging.getLogger("git-repeat"), {'repo': repo_path}))
+                   for repo_path in repo_paths}
+
+    failures = 0
+    for repo_path, future in futures.items():
+        if future.exception() is None:
+            logging.getLogger("git-repeat").info(f"Repository \"{repo_path}\" succeeded")
+        else:
+            logging.getLogger("git-repeat").error(f"Repository \"{repo_path}\" failed: {future.exception()}")
+            failures += 1
+
+    logging.getLogger("git-repeat").info(f"Recipe applied to {len(repo_paths) - failures} of {len(repo_paths)} repositories")
+    if failures > 0:
+        raise ValueError(f"Recipe could not be applied to {failures} of {len(repo_paths)} repositories")
+
+
+def _expand_repo_paths(repo_paths):
+    if isinstance(repo_paths, str):
+        repo_paths = [repo_paths]
+
+    expanded = []
+    for repo_path in repo_paths:
+        if glob.has_magic(repo_path):
+            matches = [match for match in sorted(glob.glob(repo_path)) if os.path.isdir(match)]
+            if len(matches) < 1:
+                raise ValueError(f"No folder matches \"{repo_path}\"")
+        else:
+            matches = [repo_path]
+
+        expanded += [match for match in matches if match not in expanded]
+
+    return expanded
+
+
+def _apply_repository(repo_path, data, recipe_hash, replacements, encoding, dry_run, check_keys, logger):
+    ledger = ledger_open(repo_path, recipe_hash)
+    replacements_hashes = [content_hash(r) for r in (replacements if isinstance(replacements, list) else [replacements])]
+    if ledger_is_complete(ledger, replacements_hashes):
+        logger.info(f"Already applied with these replacements, nothing to do")
+        return
+
+    data_check_files_exist(repo_path, data, logger)
+
+    try:
+        ledger_set_complete(ledger, replacements_hashes, False)
+
+        if isinstance(replacements, list):
+            logger.info(f"Multiple replacements provided")
+
+            counter = 1
+            for r in replacements:
+                logger.info(f"Run #{counter}")
+                if check_keys:
+                    _check_keys_replacements(data['keys'], r)
+                update_repository(repo_path, encoding, dry_run, r, data, ledger, logger)
+                counter += 1
+        else:
+            if check_keys:
+                _check_keys_replacements(data['keys'], replacements)
+            update_repository(repo_path, encoding, dry_run, replacements, data, ledger, logger)
+
+        ledger_set_complete(ledger, replacements_hashes, True)
+    finally:
+        if not dry_run:
+            ledger_save(ledger)
 
 
 def _check_keys_replacements(keys, replacements):
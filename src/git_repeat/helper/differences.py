@@ -15,10 +15,137 @@ from __future__ import annotations
 
 import os
 import re
+import codecs
+import hashlib
 import logging
 import difflib
+import functools
 from datetime import datetime
 from git import Repo, Commit, Diff, DiffIndex
+from .ledger import content_hash, operation_key, ledger_applied, ledger_record
+
+
+# -------------------------
+# Bytes and encodings
+#
+# files in an ascii compatible encoding are never decoded, their bytes are viewed as latin-1 instead,
+# which maps every byte to exactly one character. tokenizing, diffing and replacing therefore work
+# on the original bytes and writing the view back out restores them exactly, including line endings
+# -------------------------
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be')
+]
+
+# same whitespaces as \s matches in decoded text, but as utf-8 sequences inside a latin-1 view
+_UTF8_WHITESPACE = re.compile('((?:[\t\n\x0b\x0c\r\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)+)')
+_TEXT_WHITESPACE = re.compile(r'(\s+)')
+
+
+@functools.lru_cache(maxsize=None)
+def _codec(encoding: str):  # -> view encoding, whitespace pattern
+    if codecs.lookup(encoding).name in ['utf-8', 'utf-8-sig']:
+        return 'latin-1', _UTF8_WHITESPACE
+
+    chars = _single_byte_chars(encoding)
+    if chars is not None and all(chars[b] == chr(b) for b in range(128)):
+        whitespace = "".join(re.escape(chr(b)) for b, c in enumerate(chars) if c is not None and c.isspace())
+        return 'latin-1', re.compile(f"([{whitespace}]+)")
+
+    return encoding, _TEXT_WHITESPACE
+
+
+def _single_byte_chars(encoding: str):  # -> character of every byte, None if undefined
+    # every byte has to stand for one character on its own, without escape or shift state.
+    # undefined bytes are fine, as long as they do not start a multi byte sequence either
+    chars = []
+    for b in range(256):
+        try:
+            c = bytes([b]).decode(encoding)
+        except UnicodeDecodeError:
+            for t in range(256):
+                try:
+                    bytes([b, t]).decode(encoding)
+                    return None
+                except UnicodeDecodeError:
+                    pass
+            chars.append(None)
+            continue
+
+        if len(c) != 1 or c.encode(encoding) != bytes([b]):
+            return None
+        chars.append(c)
+
+    defined = bytes(b for b, c in enumerate(chars) if c is not None)
+    if defined.decode(encoding) != "".join(c for c in chars if c is not None):
+        return None
+
+    return chars
+
+
+def _detect_encoding(raw: bytes, fallback: str):  # -> encoding, bom
+    for bom, encoding in _BOMS:
+        if raw.startswith(bom):
+            return encoding, bom
+
+    fallback = codecs.lookup(fallback).name
+    if _codec(fallback)[0] == fallback:
+        # not ascii compatible, can not be told apart from ascii
+        return fallback, b''
+
+    # ascii is valid in every ascii compatible encoding, replacements are stored in the one asked for
+    if raw.isascii():
+        return 'utf-8' if fallback in ['utf-8', 'utf-8-sig'] else fallback, b''
+
+    try:
+        raw.decode('utf-8')
+        return 'utf-8', b''
+    except UnicodeDecodeError:
+        return 'latin-1' if fallback in ['utf-8', 'utf-8-sig'] else fallback, b''
+
+
+def _read_view(raw: bytes, fallback: str):  # -> encoding, bom, view
+    encoding, bom = _detect_encoding(raw, fallback)
+    return encoding, bom, raw[len(bom):].decode(_codec(encoding)[0])
+
+
+def _to_view(text: str, encoding: str) -> str:
+    view_encoding = _codec(encoding)[0]
+    return text.encode(encoding).decode(view_encoding) if view_encoding != encoding else text
+
+
+def _to_text(view: str, encoding: str) -> str:
+    view_encoding = _codec(encoding)[0]
+    return view.encode(view_encoding).decode(encoding) if view_encoding != encoding else view
+
+
+def _change_to_view(value: str, changes, encoding: str) -> str:
+    # changes from git are already stored as view, changes from recipes as text
+    if changes.get('encoding') == encoding:
+        return value
+    if changes.get('encoding') is not None:
+        value = _to_text(value, changes['encoding'])
+
+    return _to_view(value, encoding)
+
+
+def _change_to_text(value: str, changes) -> str:
+    return _to_text(value, changes['encoding']) if changes.get('encoding') is not None else value
+
+
+def _blob_hash(raw: bytes) -> str:
+    # same as git's blob id, so recipes can take fingerprints straight from the commit
+    sha = hashlib.sha1(b"blob %d\0" % len(raw))
+    sha.update(raw)
+    return sha.hexdigest()
+
+
+def _file_blob_hash(file_path: str) -> str:
+    with open(file_path, mode="rb") as f:
+        return _blob_hash(f.read())
 
 
 # -------------------------
@@ -81,29 +208,98 @@ def _get_difference(current, previous):
     return inserts, removals
 
 
-def _check_path(patterns: list[str], path:str):
+def _compile_patterns(patterns: list[str]):
+    compiled = []
     for pattern in patterns:
-        if re.search(pattern, path):
-            return True
-    return False
+        try:
+            compiled.append(re.compile(pattern))
+        except re.error as e:
+            raise ValueError(f"Invalid pattern \"{pattern}\": {e}")
+
+    return compiled
+
+
+def _pattern_to_prefix(pattern: str):
+    # only anchored literal folders like ^vendor/ or ^vendor/.* can be handed to git as pathspec
+    if len(pattern) < 2 or pattern[0] != '^':
+        return None
+
+    prefix, i = "", 1
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            prefix += pattern[i + 1]
+            i += 2
+        elif c in ".^$*+?{}[]|()\\":
+            break
+        else:
+            prefix += c
+            i += 1
 
+    if pattern[i:] not in ["", ".*"] or len(prefix) < 2 or prefix[-1] != '/':
+        return None
 
-def diff_to_data(diffs: DiffIndex, keys: list[str], encoding: str, exclude: list[str], include: list[str], version: str):
-    data = {
-        'version': version,
-        'keys': keys,
-        'changes': {},
-        'copies': []
-    }
+    return prefix
+
+
+def compile_path_filter(exclude: list[str], include: list[str]):
+    return _compile_patterns(exclude), _compile_patterns(include)
+
+
+def path_filter_to_pathspecs(exclude: list[str], include: list[str]) -> list[str]:
+    pathspecs = []
+
+    includes = [_pattern_to_prefix(pattern) for pattern in include]
+    if len(includes) > 0 and None not in includes:
+        pathspecs += [f":(top,literal){prefix}" for prefix in includes]
+
+    for pattern in exclude:
+        prefix = _pattern_to_prefix(pattern)
+        if prefix is not None:
+            pathspecs.append(f":(top,literal,exclude){prefix}")
+
+    return pathspecs
 
+
+def _pruned_pathspecs(pathspecs: list[str]) -> list[list[str]]:
+    # everything left out by the pathspecs: the excluded folders, and everything outside of the included folders
+    excluded = [spec.replace(":(top,literal,exclude)", ":(top,literal)", 1) for spec in pathspecs if spec.startswith(":(top,literal,exclude)")]
+    outside = [spec.replace(":(top,literal)", ":(top,literal,exclude)", 1) for spec in pathspecs if spec.startswith(":(top,literal)")]
+
+    return [specs for specs in [excluded, outside] if len(specs) > 0]
+
+
+def diff_commits(commit_from: Commit, commit_to: Commit, exclude: list[str], include: list[str]) -> DiffIndex:
+    pathspecs = path_filter_to_pathspecs(exclude, include)
+
+    # git limits the paths before detecting renames, a file moved out of a pruned folder would show up as a new file
+    for specs in _pruned_pathspecs(pathspecs):
+        if commit_from.repo.git.diff('--no-renames', '--name-only', '--diff-filter=D', commit_from.hexsha, commit_to.hexsha, '--', *specs):
+            logging.getLogger("git-repeat").debug(f"Files deleted in pruned folders, diffing without pathspecs to keep renames")
+            pathspecs = []
+            break
+
+    return commit_from.diff(commit_to, paths=pathspecs)
+
+
+def _check_path(path_filter, path: str) -> str:
+    exclude, include = path_filter
+    if len(include) > 0 and not any(pattern.search(path) for pattern in include):
+        return "XI"
+    if any(pattern.search(path) for pattern in exclude):
+        return "XE"
+    return ""
+
+
+def iter_diff_data(diffs: DiffIndex, encoding: str, path_filter):  # -> kind, path, changes or template
     for diff in diffs:
-        if len(exclude) > 0 and _check_path(exclude, diff.a_path):
-            continue
-        if len(include) > 0 and not _check_path(include, diff.a_path):
+        if _check_path(path_filter, diff.a_path):
             continue
 
         if diff.new_file:
-            data['copies'].append(diff.a_path)
+            yield 'copies', diff.a_path, {
+                'sha1': diff.b_blob.hexsha
+            }
 
         elif diff.deleted_file:
             continue
@@ -112,72 +308,172 @@ def diff_to_data(diffs: DiffIndex, keys: list[str], encoding: str, exclude: list
             continue
 
         else:
-            previous_text = diff.a_blob.data_stream.read().decode(encoding)
-            current_text = diff.b_blob.data_stream.read().decode(encoding)
+            current_encoding, _, current_text = _read_view(diff.b_blob.data_stream.read(), encoding)
+            previous_encoding, _, previous_text = _read_view(diff.a_blob.data_stream.read(), encoding)
+            if previous_encoding != current_encoding:
+                previous_text = _to_view(_to_text(previous_text, previous_encoding), current_encoding)
 
-            previous = re.split(r'(\s+)', previous_text)
-            current = re.split(r'(\s+)', current_text)
+            whitespace = _codec(current_encoding)[1]
+            previous = whitespace.split(previous_text)
+            current = whitespace.split(current_text)
 
             inserts, removals = _get_difference(current, previous)
 
             if len(inserts) < 1:
                 continue
 
-            data['changes'][diff.a_path] = {
+            yield 'changes', diff.a_path, {
                 'inserts': inserts,
                 'removals': removals,
-                'file': current_text
+                'file': current_text,
+                'encoding': current_encoding,
+                'sha1': diff.b_blob.hexsha,
+                'tokens': len(current)
             }
 
+
+def colliding_paths(diffs: DiffIndex, path_filter, replacements) -> set[str]:
+    # files are grouped by their source path, a copy reads its template and writes one target per replacement set
+    touched = {}
+    for diff in diffs:
+        if _check_path(path_filter, diff.a_path) or diff.deleted_file or diff.renamed_file:
+            continue
+
+        if diff.new_file:
+            touched.setdefault(diff.a_path, []).append((diff.a_path, False))
+            for r in replacements:
+                touched.setdefault(_copy_target(diff.a_path, r), []).append((diff.a_path, True))
+        else:
+            touched.setdefault(diff.a_path, []).append((diff.a_path, True))
+
+    # sources of files written by one group and touched by another must keep the order of update_repository
+    colliding = set()
+    for path, groups in touched.items():
+        sources = set(source for source, _ in groups)
+        if len(sources) > 1 and any(writes for _, writes in groups):
+            colliding |= sources
+
+    return colliding
+
+
+def diff_to_data(diffs: DiffIndex, keys: list[str], encoding: str, path_filter, version: str):
+    data = {
+        'version': version,
+        'keys': keys,
+        'changes': {},
+        'copies': [],
+        'templates': {}
+    }
+
+    for kind, path, changes in iter_diff_data(diffs, encoding, path_filter):
+        if kind == 'copies':
+            data['copies'].append(path)
+            data['templates'][path] = changes
+        else:
+            data['changes'][path] = changes
+
     return data
 
 
-def data_check_files_exist(repo_path: str, data):
+def data_check_files_exist(repo_path: str, data, logger=None):
+    logger = logger or logging.getLogger("git-repeat")
     errors = []
 
     for copy in data['copies']:
         if not os.path.exists(os.path.join(repo_path, copy)):
             errors.append(f"COPY file \"{copy}\" does not exist")
+            continue
+
+        template = data['templates'].get(copy)
+        if template is not None and template['sha1'] is not None and _file_blob_hash(os.path.join(repo_path, copy)) != template['sha1']:
+            logger.warning(f"COPY file \"{copy}\" changed since recipe was created, copies will contain these changes")
 
     for update in data['changes']:
-        if len(data['changes'][update]['inserts']) < 1:
+        changes = data['changes'][update]
+        if len(changes['inserts']) < 1:
             continue
 
         if not os.path.exists(os.path.join(repo_path, update)):
             errors.append(f"UPDATE file \"{update}\" does not exist")
+            continue
+
+        # without FILE contents changes made since can not be tracked, positions would be wrong
+        if changes['file'] is None and changes.get('sha1') is not None and _file_blob_hash(os.path.join(repo_path, update)) != changes['sha1']:
+            errors.append(f"UPDATE file \"{update}\" changed since recipe was created and recipe has no FILE contents")
 
     if len(errors) > 0:
-        raise ValueError(f"File(s) required by this recipe do(es) not exist in repo \"{repo_path}\":\n" + "\n".join(errors))
+        raise ValueError(f"File(s) required by this recipe do(es) not exist or do(es) not match in repo \"{repo_path}\":\n" + "\n".join(errors))
 
 
 # -------------------------
 # Handle copies and updates
 # -------------------------
-def update_repository(repo_path: str, encoding: str, dry_run: bool, replacements, data):
+def update_repository(repo_path: str, encoding: str, dry_run: bool, replacements, data, ledger=None, logger=None):
     for copy in data['copies']:
-        logging.getLogger("git-repeat").info(f"Copying file {copy}")
-        _process_new(repo_path, copy, encoding, dry_run, replacements)
+        update_file(repo_path, encoding, dry_run, replacements, 'copies', copy, None, ledger, logger)
 
     for change in data['changes']:
-        logging.getLogger("git-repeat").info(f"Updating file {change}")
-        _process_change(repo_path, change, encoding, dry_run, data['changes'][change], replacements)
+        update_file(repo_path, encoding, dry_run, replacements, 'changes', change, data['changes'][change], ledger, logger)
+
+
+def _copy_target(copy: str, replacements) -> str:
+    for search, replace in replacements.items():
+        copy = copy.replace(search, replace)
+
+    return copy
+
+
+def update_file(repo_path: str, encoding: str, dry_run: bool, replacements, kind: str, path: str, changes, ledger=None, logger=None):
+    logger = logger or logging.getLogger("git-repeat")
+    target = _copy_target(path, replacements) if kind == 'copies' else path
+
+    replacements_hash = content_hash(replacements)
+    operation = operation_key(kind, path, target)
+    applied = ledger_applied(ledger, operation, target)
+    if replacements_hash in applied:
+        logger.info(f"Skipping file {target}, already applied")
+        return
 
+    if kind == 'copies':
+        logger.info(f"Copying file {path}")
+        _process_new(repo_path, path, encoding, dry_run, replacements, logger)
+    else:
+        logger.info(f"Updating file {path}")
+        _process_change(repo_path, path, encoding, dry_run, changes, replacements, logger)
 
-def _process_change(repo_path: str, file: str, encoding: str, dry_run: bool, changes, replacements):
+    if not dry_run:
+        ledger_record(ledger, operation, target, applied + [replacements_hash])
+
+
+def _process_change(repo_path: str, file: str, encoding: str, dry_run: bool, changes, replacements, logger):
     file_path = os.path.join(repo_path, file)
-    with open(file_path, mode="r", encoding=encoding) as f:
-        contents = f.read()
-        contents = re.split(r'(\s+)', contents)
+    with open(file_path, mode="rb") as f:
+        raw = f.read()
 
-    untracked = _untracked_offset(re.split(r'(\s+)', changes['file']), contents) if changes['file'] is not None else []
     inserts, removals = changes['inserts'], changes['removals']
 
     if len(inserts) < 1:
         return
 
+    encoding, bom, contents = _read_view(raw, encoding)
+    whitespace = _codec(encoding)[1]
+    contents = whitespace.split(contents)
+    replacements = {_to_view(search, encoding): _to_view(replace, encoding) for search, replace in replacements.items()}
+
+    # file is exactly as recorded by the recipe, there are no untracked changes to offset
+    exact = changes.get('sha1') is not None and _blob_hash(raw) == changes['sha1']
+    if exact:
+        logger.debug(f"File {file} matches recipe, skipping untracked offsets")
+        untracked = []
+    else:
+        untracked = _untracked_offset(whitespace.split(_change_to_view(changes['file'], changes, encoding)), contents) if changes['file'] is not None else []
+
     offset = 0
     for b in inserts:
-        text = b[1]
+        if exact and (b[0] > changes['tokens'] or (b[0] == changes['tokens'] and b[0] in removals)):
+            raise ValueError(f"Recipe position {b[0]} is outside of UPDATE file \"{file}\" with {changes['tokens']} tokens")
+
+        text = _change_to_view(b[1], changes, encoding)
         for search, replace in replacements.items():
             text = text.replace(search, replace)
 
@@ -191,43 +487,55 @@ def _process_change(repo_path: str, file: str, encoding: str, dry_run: bool, cha
             contents.insert(b[0] + offset + untracked_offset, text)
             offset += 1
 
-        info = text.replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
-        logging.getLogger("git-repeat").debug(f'Updated at line {b[0]} (+offset {offset + untracked_offset}) with "{info}"')
+        info = _to_text(text, encoding).replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
+        logger.debug(f'Updated at line {b[0]} (+offset {offset + untracked_offset}) with "{info}"')
+
+    if exact:
+        # inserts at a removed position replace that token, all others add one
+        expected = changes['tokens'] + len([b for b in inserts if b[0] not in removals])
+        if len(contents) != expected:
+            raise ValueError(f"Updated file \"{file}\" has {len(contents)} tokens instead of {expected}, file was not written")
 
     if dry_run:
         return
 
-    with open(file_path, mode='w', encoding=encoding) as f:
-        f.write(''.join(contents))
+    with open(file_path, mode='wb') as f:
+        f.write(bom + ''.join(contents).encode(_codec(encoding)[0]))
         f.flush()
 
 
-def _process_new(repo_path: str, copy: str, encoding: str, dry_run: bool, replacements):
+def _process_new(repo_path: str, copy: str, encoding: str, dry_run: bool, replacements, logger):
     template_rel_path = copy
-    new_rel_path = template_rel_path
-    for search, replace in replacements.items():
-        new_rel_path = new_rel_path.replace(search, replace)
+    new_rel_path = _copy_target(template_rel_path, replacements)
 
     template_path = os.path.join(repo_path, template_rel_path)
     new_path = os.path.join(repo_path, new_rel_path)
 
-    with open(template_path, mode="r", encoding=encoding) as f:
+    with open(template_path, mode="rb") as f:
         contents = f.read()
 
     if len(contents) < 1:
-        logging.getLogger("git-repeat").debug(f"Empty file, skipping.")
+        logger.debug(f"Empty file, skipping.")
         return
 
-    for search, replace in replacements.items():
-        contents = contents.replace(search, replace)
+    encoding, bom = _detect_encoding(contents, encoding)
+    if _codec(encoding)[0] == 'latin-1':
+        # ascii compatible, replace directly on bytes, files without any key are copied as they are
+        for search, replace in replacements.items():
+            contents = contents.replace(search.encode(encoding), replace.encode(encoding))
+    else:
+        text = contents[len(bom):].decode(encoding)
+        for search, replace in replacements.items():
+            text = text.replace(search, replace)
+        contents = bom + text.encode(encoding)
 
-    logging.getLogger("git-repeat").debug(f"New file {new_rel_path}")
+    logger.debug(f"New file {new_rel_path}")
 
     if dry_run:
         return
 
     os.makedirs(os.path.dirname(new_path), exist_ok=True)
-    with open(new_path, mode="w", encoding=encoding) as f:
+    with open(new_path, mode="wb") as f:
         f.write(contents)
         f.flush()
 
@@ -235,15 +543,15 @@ def _process_new(repo_path: str, copy: str, encoding: str, dry_run: bool, replac
 # -------------------------
 # Recipe IO
 # -------------------------
-def data_to_recipe(repo: Repo, commit_from: Commit, commit_to: Commit, diffs: DiffIndex, exclude: list[str], include: list[str], data) -> str:
+def data_to_recipe(repo: Repo, commit_from: Commit, commit_to: Commit, diffs: DiffIndex, path_filter, data) -> str:
     output = "# git-repeat recipe\n"
     output += "#\n"
     output += "# syntax:\n"
     output += "#\t# <COMMENT>\tcomments must start with # and are not treated as such inside |...|\n"
     output += "#\tVERSION<TAB><VERSION>\tfile syntax version used, should appear only once at the top\n"
     output += "#\tKEY<TAB>|<KEY>|\tkey that can be used for replacements with this recipe, supports multi line\n"
-    output += "#\tCOPY<TAB><RELATIVE PATH>\tfiles that are added newly will be copied and texts replaced\n"
-    output += "#\tUPDATE<TAB><RELATIVE PATH>\tupdates made to files will be replicated with text replacing, followed by lines with <TAB> seperated:\n"
+    output += "#\tCOPY<TAB><RELATIVE PATH>[<TAB><HASH>]\tfiles that are added newly will be copied and texts replaced\n"
+    output += "#\tUPDATE<TAB><RELATIVE PATH>[<TAB><HASH><TAB><TOKENS>]\tupdates made to files will be replicated with text replacing, followed by lines with <TAB> seperated:\n"
     output += "#\t\t<OPERATION><TAB><POSITION><TAB>|<CONTENTS>|\n"
     output += "#\n"
     output += "#\t\toperation: + or -, if any plus + and minus - share the same line number it will replaced, otherwise it will be inserted at this position\n"
@@ -265,6 +573,9 @@ def data_to_recipe(repo: Repo, commit_from: Commit, commit_to: Commit, diffs: Di
     output += "#\tFILE<TAB><RELATIVE PATH><TAB>|<CONTENTS>|\tfiles that are part of updates are stored alongside this recipe\n"
     output += "#\t                                         \tthis allows for tracking of changes made after this recipe was created\n"
     output += "#\n"
+    output += "#\thash and tokens (since v1.1) are optional, hash is the git blob id of the file and tokens the number of UPDATE file\n"
+    output += "#\tpositions after splitting by whitespaces, files still matching their hash are updated without tracking changes\n"
+    output += "#\n"
     output += "# feel free to edit this recipe, have fun :)\n"
     output += "#\n"
     output += f'# this file was created at \"{datetime.utcnow():%Y-%m-%d %H:%M:%S+0000}\" from:\n'
@@ -277,11 +588,9 @@ def data_to_recipe(repo: Repo, commit_from: Commit, commit_to: Commit, diffs: Di
     output += "# - files: ([A]dded, [M]odified, [R]enamed, [D]eleted, e[X]cluded-by-[E]xclude, e[X]cluded-by-[I]nclude)\n"
 
     for diff in diffs:
-        info = ""
-        if len(exclude) > 0 and _check_path(exclude, diff.a_path):
-            info = " XE"
-        if len(include) > 0 and not _check_path(include, diff.a_path):
-            info = " XI"
+        info = _check_path(path_filter, diff.a_path)
+        if len(info) > 0:
+            info = f" {info}"
 
         if diff.new_file:
             output += f"#\tA{info}\t{diff.a_path}\n"
@@ -299,45 +608,87 @@ def data_to_recipe(repo: Repo, commit_from: Commit, commit_to: Commit, diffs: Di
         output += f"KEY\t|{key}|\n"
 
     for copy in data['copies']:
-        output += f"COPY\t{copy}\n"
+        output += f"COPY\t{copy}{_fingerprint_to_recipe(data['templates'].get(copy))}\n"
 
     for update in data['changes']:
         if len(data['changes'][update]['inserts']) < 1:
             continue
 
-        output += f"UPDATE\t{update}\n"
+        output += f"UPDATE\t{update}{_fingerprint_to_recipe(data['changes'][update])}\n"
         for b in data['changes'][update]['inserts']:
             if b[0] in data['changes'][update]['removals']:
                 output += f"-\t{b[0]}\n"
 
-            output += f"+\t{b[0]}\t|{b[1]}|\n"
+            output += f"+\t{b[0]}\t|{_change_to_text(b[1], data['changes'][update])}|\n"
 
     for update in data['changes']:
         if len(data['changes'][update]['inserts']) < 1:
             continue
 
-        output += f"FILE\t{update}\t|{data['changes'][update]['file']}|\n"
+        output += f"FILE\t{update}\t|{_change_to_text(data['changes'][update]['file'], data['changes'][update])}|\n"
 
     return output
 
 
+def _fingerprint_to_recipe(fingerprint) -> str:
+    if fingerprint is None or fingerprint.get('sha1') is None:
+        return ""
+    if fingerprint.get('tokens') is None:
+        return f"\t{fingerprint['sha1']}"
+
+    return f"\t{fingerprint['sha1']}\t{fingerprint['tokens']}"
+
+
+def _fingerprint_from_recipe(i, elements, tokens=True):
+    if len(elements) < 3 or (tokens and len(elements) < 4):
+        return None, None
+
+    if not tokens:
+        return elements[2].strip(), None
+
+    try:
+        return elements[2].strip(), int(elements[3])
+    except ValueError:
+        raise ValueError(f"Recipe line {i}, {elements[0]} expects hash and tokens")
+
+
+def _change_entry(data, block_file):
+    if block_file not in data['changes']:
+        data['changes'][block_file] = {
+            'inserts': [],
+            'removals': [],
+            'file': None,
+            'encoding': None,
+            'sha1': None,
+            'tokens': None
+        }
+
+    return data['changes'][block_file]
+
+
+def _block_end(block):  # -> offset of closing pipe and newline, None if block is still open
+    if block[-2:] == "|\n":
+        return -2
+    if block[-3:] == "|\r\n":
+        return -3
+    return None
+
+
 def _add_block(data, block_file, block_type, block_index, block, offset=-2):
+    if offset < 0:
+        block = block[:offset]
+
     if block_type == 'keys':
-        data['keys'].append(block[:offset])
+        data['keys'].append(block)
     elif block_type in ['inserts', 'removals', 'file']:
-        if block_file not in data['changes']:
-            data['changes'][block_file] = {
-                'inserts': [],
-                'removals': [],
-                'file': None
-            }
+        changes = _change_entry(data, block_file)
 
         if block_type == 'inserts':
-            data['changes'][block_file]['inserts'].append((block_index, block[:offset]))
+            changes['inserts'].append((block_index, block))
         elif block_type == 'removals':
-            data['changes'][block_file]['removals'].append(block_index)
+            changes['removals'].append(block_index)
         elif block_type == 'file':
-            data['changes'][block_file]['file'] = block
+            changes['file'] = block
 
 
 def _handle_command(i, elements, data, block_file):  # -> block_file, block_type, block_index, block
@@ -356,10 +707,18 @@ def _handle_command(i, elements, data, block_file):  # -> block_file, block_type
         return None, "keys", -1, elements[1][1:]
 
     elif elements[0] == "COPY":
+        sha1, _ = _fingerprint_from_recipe(i, elements, tokens=False)
         data['copies'].append(elements[1].strip())
+        data['templates'][elements[1].strip()] = {
+            'sha1': sha1
+        }
         return None, None, -1, ""
 
     elif elements[0] == "UPDATE":
+        sha1, tokens = _fingerprint_from_recipe(i, elements)
+        if sha1 is not None:
+            changes = _change_entry(data, elements[1].strip())
+            changes['sha1'], changes['tokens'] = sha1, tokens
         return elements[1].strip(), None, -1, ""
 
     elif elements[0] == "+":
@@ -393,7 +752,8 @@ def recipe_to_data(recipe):
         'version': "",
         'keys': [],
         'changes': {},
-        'copies': []
+        'copies': [],
+        'templates': {}
     }
 
     commands = ["VERSION", "KEY", "COPY", "UPDATE", "+", "-", "FILE"]
@@ -418,8 +778,8 @@ def recipe_to_data(recipe):
         if elements[0] in commands:
             if block_type is not None:
                 # check if last block has ended with a pipe or is an empty block
-                if len(block) >= 2 and block[-2:] == "|\n":
-                    _add_block(data, block_file, block_type, block_index, block)
+                if _block_end(block) is not None:
+                    _add_block(data, block_file, block_type, block_index, block, _block_end(block))
                     block_file, block_type, block_index, block = _handle_command(i, elements, data, block_file)
                 # else we continue on, command is likely part of block
                 else:
@@ -437,7 +797,7 @@ def recipe_to_data(recipe):
 
     if block_type is not None:
         # check if there is a pipe in the end, if so the block can be added
-        check = block.rstrip("\n ")
+        check = block.rstrip("\r\n ")
         if (
             len(check) >= 1 and check[-1] == "|"
         ):
@@ -456,4 +816,9 @@ def recipe_to_data(recipe):
         if data['changes'][update]['file'] is None:
             logging.getLogger("git-repeat").warning(f"Recipe is missing corresponding FILE contents for UPDATE file \"{update}\"")
 
+        elif data['changes'][update]['tokens'] is not None and len(re.split(r'(\s+)', data['changes'][update]['file'])) != data['changes'][update]['tokens']:
+            # FILE contents were edited, only rely on them from now on
+            logging.getLogger("git-repeat").warning(f"Recipe FILE contents for UPDATE file \"{update}\" do not match its tokens, ignoring hash")
+            data['changes'][update]['sha1'] = None
+
     return data
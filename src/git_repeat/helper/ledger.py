@@ -0,0 +1,177 @@
+# This file is part of git-repeat.
+#
+# git-repeat is free software: you can redistribute it and/or modify it under the terms
+# of the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+#
+# git-repeat is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with git-repeat.
+# If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from git import Repo
+from git.exc import InvalidGitRepositoryError, NoSuchPathError
+
+LEDGER_FOLDER = 'git-repeat'
+
+
+# -------------------------
+# Applied-state ledger stored at .git/git-repeat/<recipe hash>.json
+#
+# for every operation (copy or change of a file) the ledger remembers the replacement sets applied by it, and for
+# every written file its state after the last write. operations are only skipped if their file is still exactly in
+# that state. replacement sets of runs which finished without errors are marked as complete
+# -------------------------
+def content_hash(value) -> str:
+    if not isinstance(value, (bytes, str)):
+        value = json.dumps(value, sort_keys=True)
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+
+    return hashlib.sha1(value).hexdigest()
+
+
+def _file_hash(file_path: str) -> str:
+    sha = hashlib.sha1()
+    with open(file_path, mode='rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def _file_matches(ledger, rel_path: str) -> bool:
+    state = ledger['files'].get(rel_path)
+    if state is None:
+        return False
+
+    file_path = os.path.join(ledger['repo'], rel_path)
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return False
+
+    if stat.st_size != state['size']:
+        return False
+
+    # unchanged size and modification time, no need to read the file
+    return stat.st_mtime_ns == state['mtime_ns'] or _file_hash(file_path) == state['sha1']
+
+
+def operation_key(kind: str, path: str, target: str) -> str:
+    return f"{kind}\t{path}\t{target}"
+
+
+def ledger_open(repo_path: str, recipe_hash: str):
+    try:
+        git_dir = Repo(repo_path).git_dir
+    except (InvalidGitRepositoryError, NoSuchPathError):
+        logging.getLogger("git-repeat").debug(f"No git repository at \"{repo_path}\", applied-state ledger disabled")
+        return None
+
+    ledger_path = os.path.join(git_dir, LEDGER_FOLDER, f"{recipe_hash}.json")
+    stored = {}
+    if os.path.exists(ledger_path):
+        try:
+            with open(ledger_path, mode='r', encoding='utf-8') as lf:
+                stored = json.load(lf)
+        except ValueError as e:
+            logging.getLogger("git-repeat").warning(f"Ignoring unreadable ledger \"{ledger_path}\": {e}")
+
+    return {
+        'path': ledger_path,
+        'repo': repo_path,
+        'files': stored.get('files', {}),
+        'operations': stored.get('operations', {}),
+        'complete': stored.get('complete', []),
+        'lock': threading.Lock()
+    }
+
+
+def ledger_is_complete(ledger, replacements_hashes: list[str]) -> bool:
+    if ledger is None:
+        return False
+
+    with ledger['lock']:
+        if any(h not in ledger['complete'] for h in replacements_hashes):
+            return False
+
+        return all(_file_matches(ledger, rel_path) for rel_path in ledger['files'])
+
+
+def ledger_set_complete(ledger, replacements_hashes: list[str], complete: bool):
+    if ledger is None:
+        return
+
+    with ledger['lock']:
+        ledger['complete'] = [h for h in ledger['complete'] if h not in replacements_hashes]
+        if complete:
+            ledger['complete'] += replacements_hashes
+
+
+def ledger_applied(ledger, operation: str, target: str) -> list[str]:
+    if ledger is None:
+        return []
+
+    with ledger['lock']:
+        if not _file_matches(ledger, target):
+            # file changed outside of git-repeat, no operation writing it can be trusted anymore
+            ledger['files'].pop(target, None)
+            for entry in ledger['operations'].values():
+                if entry['target'] == target:
+                    entry['replacements'] = []
+            return []
+
+        entry = ledger['operations'].get(operation)
+        return list(entry['replacements']) if entry is not None else []
+
+
+def ledger_record(ledger, operation: str, target: str, applied: list[str]):
+    if ledger is None:
+        return
+
+    file_path = os.path.join(ledger['repo'], target)
+    if not os.path.exists(file_path):
+        return
+
+    stat = os.stat(file_path)
+    state = {
+        'sha1': _file_hash(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+    with ledger['lock']:
+        ledger['files'][target] = state
+        ledger['operations'][operation] = {
+            'target': target,
+            'replacements': applied
+        }
+
+
+def ledger_save(ledger):
+    if ledger is None:
+        return
+
+    os.makedirs(os.path.dirname(ledger['path']), exist_ok=True)
+    with ledger['lock']:
+        contents = json.dumps({
+            'files': ledger['files'],
+            'operations': ledger['operations'],
+            'complete': ledger['complete']
+        }, indent=1, sort_keys=True)
+
+    tmp_path = f"{ledger['path']}.tmp"
+    with open(tmp_path, mode='w', encoding='utf-8') as lf:
+        lf.write(contents)
+        lf.flush()
+    os.replace(tmp_path, ledger['path'])
@@ -18,7 +18,7 @@ import logging
 from .helper import actions
 
 VERSION = '0.1.4'
-RECIPE_VERSION = '1.0'
+RECIPE_VERSION = '1.1'
 
 
 def version_info():
@@ -65,19 +65,20 @@ def main():
 
     repo_parser = argparse.ArgumentParser(add_help=False, formatter_class=CustomFormatter)
     repo_parser.add_argument('-e', '--encoding', type=str, default='utf-8-sig', dest="encoding",
-                             help='encoding used for reading and storing files')
+                             help='encoding used for files which have no BOM and are not valid UTF-8, recipes are always UTF-8')
     repo_parser.add_argument('-d', '--debug', action="store_const", default=logging.INFO, const=logging.DEBUG, dest="loglevel",
                              help='enable verbose output')
-    repo_parser.add_argument('repo', nargs='?', type=str, default=".",
-                             help='path to source code, if using \'run\' or \'recipe\' path must point to a git repository, '
-                                  'if using \'apply\' folder structure must match recipe\'s folder structure')
+
+    git_repo_parser = argparse.ArgumentParser(add_help=False, formatter_class=CustomFormatter)
+    git_repo_parser.add_argument('repo', nargs='?', type=str, default=".",
+                                 help='path to source code, path must point to a git repository')
 
     # run
-    parser_run = subparsers.add_parser('run', formatter_class=CustomFormatter, parents=[from_to_parser, replacements_parser, repo_parser],
+    parser_run = subparsers.add_parser('run', formatter_class=CustomFormatter, parents=[from_to_parser, replacements_parser, repo_parser, git_repo_parser],
                                        help='generates recipe on the fly and applies it to repository')
 
     # recipe
-    parser_recipe = subparsers.add_parser('recipe', formatter_class=CustomFormatter, parents=[from_to_parser, repo_parser],
+    parser_recipe = subparsers.add_parser('recipe', formatter_class=CustomFormatter, parents=[from_to_parser, repo_parser, git_repo_parser],
                                           help='generate recipe from repository (to file or stdout)')
     parser_recipe.add_argument('-k', '--keys', type=str, default="[]",
                                help='text replacements keys when applying commit in json format, for example replacing '
@@ -89,6 +90,11 @@ def main():
     parser_apply = subparsers.add_parser('apply', formatter_class=CustomFormatter, parents=[replacements_parser, repo_parser],
                                          help='apply recipe to repository (from file or stdin)')
     parser_apply.add_argument('-i', '--in', type=str, default="-", dest="in_path", help='input recipe file to apply, - means stdin')
+    parser_apply.add_argument('-j', '--jobs', type=int, default=actions.RUN_WORKERS, dest="jobs",
+                              help='number of repositories the recipe is applied to in parallel')
+    parser_apply.add_argument('repo', nargs='*', type=str, default=["."],
+                              help='paths or glob patterns to source code, folder structure must match recipe\'s folder structure. '
+                                   'if multiple repositories are given, the recipe is read once and applied to all of them')
 
     args = parser.parse_args()
 
@@ -132,7 +138,7 @@ def main():
             actions.recipe(args.rev_from, args.rev_to, args.repo, args.keys, args.out_path, args.encoding, args.exclude, args.include, RECIPE_VERSION)
 
         elif args.subparser == 'apply':
-            actions.apply(args.repo, args.replacements, args.in_path, args.encoding, args.dry_run)
+            actions.apply(args.repo, args.replacements, args.in_path, args.encoding, args.dry_run, args.jobs)
 
         else:
             print_help()
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import pytest
+from git import Repo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+RECIPE_VERSION = '1.1'
+
+
+def write_files(repo_path, files):
+    for rel_path, contents in files.items():
+        file_path = os.path.join(repo_path, rel_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, mode='wb') as f:
+            f.write(contents if isinstance(contents, bytes) else contents.encode('utf-8'))
+
+
+def read_file(repo_path, rel_path):
+    with open(os.path.join(repo_path, rel_path), mode='rb') as f:
+        return f.read()
+
+
+def read_tree(repo_path):
+    tree = {}
+    for root, dirs, files in os.walk(repo_path):
+        if '.git' in dirs:
+            dirs.remove('.git')
+        for name in files:
+            rel_path = os.path.relpath(os.path.join(root, name), repo_path)
+            tree[rel_path] = read_file(repo_path, rel_path)
+
+    return tree
+
+
+@pytest.fixture
+def make_repo(tmp_path):
+    def make(name, *commits):
+        repo_path = str(tmp_path / name)
+        repo = Repo.init(repo_path)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "git-repeat")
+            config.set_value("user", "email", "git-repeat@example.com")
+
+        for i, files in enumerate(commits):
+            write_files(repo_path, files)
+            repo.git.add(A=True)
+            repo.index.commit(f"commit {i}")
+
+        return repo_path
+
+    return make
+
+
+@pytest.fixture
+def json_file(tmp_path):
+    def write(name, value):
+        file_path = str(tmp_path / name)
+        with open(file_path, mode='w') as f:
+            json.dump(value, f)
+        return file_path
+
+    return write
+
+
+ENTITY_COMMITS = (
+    {
+        'src/registry.py': 'class Base:\n    pass\n\n# register\nitems = [\n    "base",\n]\n',
+        'vendor/lib/a.py': 'vendored\n',
+        'docs/x.md': 'readme\n'
+    },
+    {
+        'src/Entity1/entity1.py': 'class Entity1:\n    name = "entity1"\n',
+        'src/registry.py': 'class Base:\n    pass\n\n# register\nitems = [\n    "base",\n    "entity1",\n]\nfrom .Entity1 import Entity1\n',
+        'vendor/lib/a.py': 'vendored changed\n',
+        'docs/x.md': 'readme2\n'
+    }
+)
+
+ENTITY_REPLACEMENTS = [
+    {"Entity1": "Entity2", "entity1": "entity2"},
+    {"Entity1": "Entity3", "entity1": "entity3"}
+]
+
+ENTITY_REGISTRY = (b'class Base:\n    pass\n\n# register\nitems = [\n    "base",\n    "entity3",\n    "entity2",\n    "entity1",\n]\n'
+                   b'from .Entity2 import Entity2\nfrom .Entity3 import Entity3\nfrom .Entity1 import Entity1\n')
+
+FOO_BAR_COMMITS = (
+    {'Bar.txt': 'a b\n'},
+    {'Foo.txt': 'hello Foo\n', 'Bar.txt': 'a b c\n'}
+)
@@ -0,0 +1,44 @@
+import os
+import json
+import logging
+import pytest
+from git_repeat.helper import actions
+from conftest import ENTITY_COMMITS, ENTITY_REPLACEMENTS, RECIPE_VERSION, read_file
+
+
+@pytest.fixture
+def entity_recipe(make_repo, tmp_path):
+    recipe_path = str(tmp_path / "entity.recipe")
+    actions.recipe("HEAD~1", "HEAD", make_repo("source", *ENTITY_COMMITS), '["Entity1", "entity1"]', recipe_path,
+                   "utf-8-sig", "[]", "[]", RECIPE_VERSION)
+    return recipe_path
+
+
+def test_apply_to_glob_of_repositories(make_repo, tmp_path, entity_recipe):
+    repo_paths = [make_repo(os.path.join("services", f"svc{i}"), *ENTITY_COMMITS) for i in range(3)]
+
+    actions.apply([str(tmp_path / "services" / "svc*")], json.dumps(ENTITY_REPLACEMENTS[0]), entity_recipe, "utf-8-sig", False, 2)
+
+    for repo_path in repo_paths:
+        assert read_file(repo_path, "src/Entity2/entity2.py") == b'class Entity2:\n    name = "entity2"\n'
+        assert b'"entity2"' in read_file(repo_path, "src/registry.py")
+
+
+def test_failing_repository_does_not_stop_others(make_repo, tmp_path, entity_recipe, caplog):
+    good = make_repo("good", *ENTITY_COMMITS)
+    bad = str(tmp_path / "bad")
+    os.makedirs(bad)
+
+    with caplog.at_level(logging.INFO, logger="git-repeat"):
+        with pytest.raises(ValueError):
+            actions.apply([good, bad], json.dumps(ENTITY_REPLACEMENTS[0]), entity_recipe, "utf-8-sig", False)
+
+    assert b'"entity2"' in read_file(good, "src/registry.py")
+    assert f"Repository \"{good}\" succeeded" in caplog.text
+    assert f"Repository \"{bad}\" failed" in caplog.text
+    assert f"[{good}] Copying file src/Entity1/entity1.py" in caplog.text
+
+
+def test_glob_without_match_raises(tmp_path, entity_recipe):
+    with pytest.raises(ValueError):
+        actions.apply([str(tmp_path / "missing*")], json.dumps(ENTITY_REPLACEMENTS[0]), entity_recipe, "utf-8-sig", False)
@@ -0,0 +1,98 @@
+import json
+import codecs
+from git_repeat.helper import actions
+from conftest import RECIPE_VERSION, read_file, read_tree
+
+
+def _run(repo_path, replacements, encoding="utf-8-sig"):
+    actions.run("HEAD~1", "HEAD", repo_path, json.dumps(replacements), encoding, "[]", "[]", False, RECIPE_VERSION)
+
+
+def test_crlf_and_bom_are_preserved(make_repo):
+    repo_path = make_repo("repo", {
+        'crlf.txt': b'items = [\r\n    "base",\r\n]\r\n',
+        'bom.txt': codecs.BOM_UTF8 + b'x = 1\n'
+    }, {
+        'crlf.txt': b'items = [\r\n    "base",\r\n    "entity1",\r\n]\r\n',
+        'bom.txt': codecs.BOM_UTF8 + b'x = 1\nentity1 = 2\n'
+    })
+
+    _run(repo_path, {"entity1": "entity2"})
+
+    assert read_file(repo_path, 'crlf.txt') == b'items = [\r\n    "base",\r\n    "entity2",\r\n    "entity1",\r\n]\r\n'
+    assert read_file(repo_path, 'bom.txt') == codecs.BOM_UTF8 + b'x = 1\nentity2 = 2\nentity1 = 2\n'
+
+
+def test_mixed_encodings_in_one_run(make_repo):
+    repo_path = make_repo("repo", {
+        'latin.txt': 'caf\xe9\n- base\n'.encode('latin-1'),
+        'utf16.txt': codecs.BOM_UTF16_LE + 'h\xe9llo\r\n- base\r\n'.encode('utf-16-le')
+    }, {
+        'latin.txt': 'caf\xe9\n- base\n- entity1 \xe9t\xe9\n'.encode('latin-1'),
+        'utf16.txt': codecs.BOM_UTF16_LE + 'h\xe9llo\r\n- base\r\n- entity1\r\n'.encode('utf-16-le'),
+        'new_entity1.txt': 'entity1 €\n'.encode('utf-8')
+    })
+
+    _run(repo_path, {"entity1": "entit\xe92"})
+
+    assert read_file(repo_path, 'latin.txt') == 'caf\xe9\n- base\n- entit\xe92 \xe9t\xe9\n- entity1 \xe9t\xe9\n'.encode('latin-1')
+    assert read_file(repo_path, 'utf16.txt') == codecs.BOM_UTF16_LE + 'h\xe9llo\r\n- base\r\n- entit\xe92\r\n- entity1\r\n'.encode('utf-16-le')
+    assert read_file(repo_path, 'new_entit\xe92.txt') == 'entit\xe92 €\n'.encode('utf-8')
+
+
+def test_ascii_files_use_fallback_encoding(make_repo):
+    repo_path = make_repo("repo", {
+        'a.txt': b'x\n'
+    }, {
+        'a.txt': b'x\nFoo\n',
+        'Foo.txt': b'Foo\n'
+    })
+
+    _run(repo_path, {"Foo": "Caf\xe9"}, encoding="cp1252")
+
+    assert read_file(repo_path, 'a.txt') == b'x\nCaf\xe9\nFoo\n'
+    assert read_file(repo_path, 'Caf\xe9.txt') == b'Caf\xe9\n'
+
+
+def test_copies_without_keys_are_copied_unchanged(make_repo):
+    binary = b'\x00\xff\x80 some bytes\r\n'
+    repo_path = make_repo("repo", {'a.txt': b'a\n'}, {'a.txt': b'a\n', 'entity1/data.bin': binary})
+
+    _run(repo_path, {"entity1": "entity2"})
+
+    assert read_file(repo_path, 'entity2/data.bin') == binary
+
+
+def test_stateful_encodings_are_decoded(make_repo):
+    repo_path = make_repo("repo", {
+        'a.txt': 'F 日本\n'.encode('iso2022_jp')
+    }, {
+        'a.txt': 'F 日本\nF 本\n'.encode('iso2022_jp'),
+        'F.txt': 'F 日本\n'.encode('iso2022_jp')
+    })
+
+    _run(repo_path, {"F": "G"}, encoding="iso2022_jp")
+
+    assert read_file(repo_path, 'a.txt').decode('iso2022_jp') == 'F 日本\nG 本\nF 本\n'
+    assert read_file(repo_path, 'G.txt').decode('iso2022_jp') == 'G 日本\n'
+
+
+def test_recipe_of_mixed_repository_with_fallback_encoding(make_repo, tmp_path):
+    commits = ({
+        'utf8.txt': 'a → b\n',
+        'latin.txt': 'caf\xe9\n'.encode('cp1252')
+    }, {
+        'utf8.txt': 'a → b\nentity1 → c\n',
+        'latin.txt': 'caf\xe9\nentity1 \xe9\n'.encode('cp1252')
+    })
+    recipe_path = str(tmp_path / "r.recipe")
+    actions.recipe("HEAD~1", "HEAD", make_repo("source", *commits), '["entity1"]', recipe_path, "cp1252", "[]", "[]", RECIPE_VERSION)
+
+    apply_path = make_repo("apply", *commits)
+    actions.apply([apply_path], json.dumps({"entity1": "entit\xe92"}), recipe_path, "cp1252", False)
+    run_path = make_repo("run", *commits)
+    _run(run_path, {"entity1": "entit\xe92"}, encoding="cp1252")
+
+    assert read_file(apply_path, 'utf8.txt') == 'a → b\nentit\xe92 → c\nentity1 → c\n'.encode('utf-8')
+    assert read_file(apply_path, 'latin.txt') == 'caf\xe9\nentit\xe92 \xe9\nentity1 \xe9\n'.encode('cp1252')
+    assert read_tree(apply_path) == read_tree(run_path)
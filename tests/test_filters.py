@@ -0,0 +1,73 @@
+import json
+import pytest
+from git import Repo
+from git_repeat.helper import actions
+from git_repeat.helper.differences import compile_path_filter, path_filter_to_pathspecs, diff_commits, _check_path
+from conftest import ENTITY_COMMITS, RECIPE_VERSION, read_file
+
+
+def test_patterns_keep_inline_flags_and_backreferences():
+    path_filter = compile_path_filter(["(?i)VENDOR", r"(a)\1"], [])
+
+    assert _check_path(path_filter, "vendor/a.py") == "XE"
+    assert _check_path(path_filter, "src/aa.py") == "XE"
+    assert _check_path(path_filter, "src/b.py") == ""
+
+
+def test_include_wins_over_exclude():
+    path_filter = compile_path_filter(["\\.md"], ["^src/"])
+
+    assert _check_path(path_filter, "docs/x.md") == "XI"
+    assert _check_path(path_filter, "src/x.md") == "XE"
+    assert _check_path(path_filter, "src/x.py") == ""
+
+
+def test_invalid_pattern_raises_value_error():
+    with pytest.raises(ValueError):
+        compile_path_filter(["("], [])
+
+
+def test_only_folder_patterns_become_pathspecs():
+    pathspecs = path_filter_to_pathspecs(["^vendor/", "\\.md", "^third\\.party/.*", "^vendor"], ["^src/"])
+
+    assert pathspecs == [":(top,literal)src/", ":(top,literal,exclude)vendor/", ":(top,literal,exclude)third.party/"]
+    assert path_filter_to_pathspecs([], ["^src/", "foo"]) == []
+
+
+def test_pathspecs_prune_excluded_folders(make_repo):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    repo = Repo(repo_path)
+
+    diffs = repo.commit("HEAD~1").diff(repo.commit("HEAD"), paths=path_filter_to_pathspecs(["^vendor/"], []))
+
+    assert sorted(diff.a_path for diff in diffs) == ["docs/x.md", "src/Entity1/entity1.py", "src/registry.py"]
+
+
+def test_run_with_excludes_leaves_excluded_files(make_repo):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+
+    actions.run("HEAD~1", "HEAD", repo_path, json.dumps({"entity1": "entity2"}), "utf-8-sig",
+                json.dumps(["^vendor/", "\\.md"]), "[]", False, RECIPE_VERSION)
+
+    assert read_file(repo_path, "vendor/lib/a.py") == b"vendored changed\n"
+    assert read_file(repo_path, "docs/x.md") == b"readme2\n"
+    assert b'"entity2"' in read_file(repo_path, "src/registry.py")
+
+
+@pytest.mark.parametrize("exclude, include", [(["^vendor/"], []), ([], ["^src/"])])
+def test_move_out_of_pruned_folder_stays_a_rename(make_repo, tmp_path, exclude, include):
+    repo_path = make_repo("repo", {'vendor/x.py': 'class Entity1:\n    pass\n', 'src/a.py': 'a\n'})
+    repo = Repo(repo_path)
+    repo.git.mv("vendor/x.py", "src/Entity1.py")
+    repo.index.commit("move")
+
+    diffs = diff_commits(repo.commit("HEAD~1"), repo.commit("HEAD"), exclude, include)
+    assert [(diff.a_path, diff.renamed_file) for diff in diffs] == [("vendor/x.py", True)]
+
+    recipe_path = str(tmp_path / "r.recipe")
+    actions.recipe("HEAD~1", "HEAD", repo_path, '["Entity1"]', recipe_path, "utf-8-sig", json.dumps(exclude), json.dumps(include), RECIPE_VERSION)
+    with open(recipe_path, mode='r', encoding='utf-8') as f:
+        assert "\nCOPY\t" not in f.read()
+
+    actions.run("HEAD~1", "HEAD", repo_path, json.dumps({"Entity1": "Entity2"}), "utf-8-sig", json.dumps(exclude), json.dumps(include), False, RECIPE_VERSION)
+    assert not (tmp_path / "repo" / "src" / "Entity2.py").exists()
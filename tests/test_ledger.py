@@ -0,0 +1,84 @@
+import os
+import json
+import shutil
+import pytest
+from git_repeat.helper import actions
+from conftest import ENTITY_COMMITS, ENTITY_REPLACEMENTS, ENTITY_REGISTRY, FOO_BAR_COMMITS, RECIPE_VERSION, read_file, read_tree
+
+
+def _run(repo_path, replacements_path):
+    actions.run("HEAD~1", "HEAD", repo_path, replacements_path, "utf-8-sig", "[]", "[]", False, RECIPE_VERSION)
+
+
+def _apply(repo_path, recipe_path, replacements_path):
+    actions.apply([repo_path], replacements_path, recipe_path, "utf-8-sig", False)
+
+
+@pytest.fixture
+def entity_recipe(make_repo, tmp_path):
+    repo_path = make_repo("source", *ENTITY_COMMITS)
+    recipe_path = str(tmp_path / "entity.recipe")
+    actions.recipe("HEAD~1", "HEAD", repo_path, '["Entity1", "entity1"]', recipe_path, "utf-8-sig", "[]", "[]", RECIPE_VERSION)
+    return recipe_path
+
+
+def test_run_twice_does_not_duplicate(make_repo, json_file):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    replacements_path = json_file("replacements.json", ENTITY_REPLACEMENTS)
+
+    _run(repo_path, replacements_path)
+    first = read_tree(repo_path)
+    _run(repo_path, replacements_path)
+
+    assert read_tree(repo_path) == first
+    assert read_file(repo_path, "src/registry.py") == ENTITY_REGISTRY
+
+
+def test_apply_twice_does_not_duplicate(make_repo, json_file, entity_recipe):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    replacements_path = json_file("replacements.json", ENTITY_REPLACEMENTS)
+
+    _apply(repo_path, entity_recipe, replacements_path)
+    first = read_tree(repo_path)
+    _apply(repo_path, entity_recipe, replacements_path)
+
+    assert read_tree(repo_path) == first
+
+
+def test_completed_run_skips_diffing(make_repo, json_file, monkeypatch):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    replacements_path = json_file("replacements.json", ENTITY_REPLACEMENTS)
+    _run(repo_path, replacements_path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("diff computed for completed run")
+
+    monkeypatch.setattr(actions, "iter_diff_data", fail)
+    _run(repo_path, replacements_path)
+
+
+def test_partially_applied_state_is_resumed(make_repo, json_file, entity_recipe):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    replacements_path = json_file("replacements.json", ENTITY_REPLACEMENTS)
+    _apply(repo_path, entity_recipe, replacements_path)
+    first = read_tree(repo_path)
+
+    shutil.rmtree(os.path.join(repo_path, "src", "Entity3"))
+    with open(os.path.join(repo_path, "src", "registry.py"), mode='wb') as f:
+        f.write(ENTITY_COMMITS[1]['src/registry.py'].encode('utf-8'))
+    _apply(repo_path, entity_recipe, replacements_path)
+
+    assert read_tree(repo_path) == first
+
+
+def test_shared_target_is_not_skipped_on_first_run(make_repo, tmp_path):
+    run_path = make_repo("run", *FOO_BAR_COMMITS)
+    apply_path = make_repo("apply", *FOO_BAR_COMMITS)
+    recipe_path = str(tmp_path / "foo.recipe")
+    actions.recipe("HEAD~1", "HEAD", apply_path, '["Foo"]', recipe_path, "utf-8-sig", "[]", "[]", RECIPE_VERSION)
+
+    actions.run("HEAD~1", "HEAD", run_path, json.dumps({"Foo": "Bar"}), "utf-8-sig", "[]", "[]", False, RECIPE_VERSION)
+    actions.apply([apply_path], json.dumps({"Foo": "Bar"}), recipe_path, "utf-8-sig", False)
+
+    assert read_file(run_path, "Bar.txt") == b"hello Bar c\n"
+    assert read_file(apply_path, "Bar.txt") == b"hello Bar c\n"
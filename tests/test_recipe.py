@@ -0,0 +1,98 @@
+import re
+import json
+import logging
+import pytest
+from git_repeat.helper import actions
+from git_repeat.helper.differences import recipe_to_data, _process_change, _blob_hash
+from conftest import ENTITY_COMMITS, ENTITY_REPLACEMENTS, RECIPE_VERSION, read_file, read_tree, write_files
+
+
+def _recipe(repo_path, recipe_path):
+    actions.recipe("HEAD~1", "HEAD", repo_path, '["Entity1", "entity1"]', recipe_path, "utf-8-sig", "[]", "[]", RECIPE_VERSION)
+    with open(recipe_path, mode='r', encoding='utf-8-sig', newline='') as f:
+        return f.read()
+
+
+def _apply(repo_path, recipe_path, replacements):
+    actions.apply([repo_path], json.dumps(replacements), recipe_path, "utf-8-sig", False)
+
+
+def test_recipe_contains_fingerprints(make_repo, tmp_path):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+
+    data = recipe_to_data(_recipe(repo_path, str(tmp_path / "r.recipe")))
+
+    assert data['version'] == '1.1'
+    assert re.fullmatch("[0-9a-f]{40}", data['templates']['src/Entity1/entity1.py']['sha1'])
+    assert data['changes']['src/registry.py']['tokens'] == len(re.split(r'(\s+)', data['changes']['src/registry.py']['file']))
+
+
+def test_v10_recipe_gives_same_result(make_repo, tmp_path):
+    recipe = _recipe(make_repo("source", *ENTITY_COMMITS), str(tmp_path / "r.recipe"))
+    v10 = re.sub(r"^(COPY|UPDATE)(\t[^\t\n]+)\t[^\n]*$", r"\1\2", recipe, flags=re.M).replace("VERSION\t1.1", "VERSION\t1.0")
+    v10_path = tmp_path / "v10.recipe"
+    v10_path.write_text(v10, encoding='utf-8')
+
+    v11_repo = make_repo("v11", *ENTITY_COMMITS)
+    v10_repo = make_repo("v10", *ENTITY_COMMITS)
+    _apply(v11_repo, str(tmp_path / "r.recipe"), ENTITY_REPLACEMENTS[0])
+    _apply(v10_repo, str(v10_path), ENTITY_REPLACEMENTS[0])
+
+    assert recipe_to_data(v10)['changes']['src/registry.py']['sha1'] is None
+    assert read_tree(v11_repo) == read_tree(v10_repo)
+
+
+def test_changed_file_without_file_contents_is_rejected(make_repo, tmp_path):
+    recipe = _recipe(make_repo("source", *ENTITY_COMMITS), str(tmp_path / "r.recipe"))
+    no_file_path = tmp_path / "no-file.recipe"
+    no_file_path.write_text(recipe[:recipe.index("FILE\t")], encoding='utf-8')
+
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    write_files(repo_path, {'src/registry.py': '# header\n' + ENTITY_COMMITS[1]['src/registry.py']})
+
+    with pytest.raises(ValueError):
+        _apply(repo_path, str(no_file_path), ENTITY_REPLACEMENTS[0])
+    assert read_file(repo_path, 'src/registry.py').startswith(b'# header\nclass Base:')
+    assert b'entity2' not in read_file(repo_path, 'src/registry.py')
+
+
+def test_changed_file_is_tracked_with_file_contents(make_repo, tmp_path):
+    recipe_path = str(tmp_path / "r.recipe")
+    _recipe(make_repo("source", *ENTITY_COMMITS), recipe_path)
+
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    write_files(repo_path, {'src/registry.py': '# header\n' + ENTITY_COMMITS[1]['src/registry.py']})
+    _apply(repo_path, recipe_path, ENTITY_REPLACEMENTS[0])
+
+    assert read_file(repo_path, 'src/registry.py') == (b'# header\nclass Base:\n    pass\n\n# register\nitems = [\n    "base",\n    "entity2",\n'
+                                                       b'    "entity1",\n]\nfrom .Entity2 import Entity2\nfrom .Entity1 import Entity1\n')
+
+
+def test_edited_file_contents_drop_hash(make_repo, tmp_path):
+    recipe = _recipe(make_repo("source", *ENTITY_COMMITS), str(tmp_path / "r.recipe"))
+
+    data = recipe_to_data(recipe.replace("    pass\n", "    pass and more\n"))
+
+    assert data['changes']['src/registry.py']['sha1'] is None
+
+
+def test_position_outside_of_file_is_rejected(make_repo, tmp_path):
+    recipe = _recipe(make_repo("source", *ENTITY_COMMITS), str(tmp_path / "r.recipe"))
+    bad_path = tmp_path / "bad.recipe"
+    bad_path.write_text(re.sub(r"^\+\t22\t", "+\t99\t", recipe, flags=re.M), encoding='utf-8')
+
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    with pytest.raises(ValueError):
+        _apply(repo_path, str(bad_path), ENTITY_REPLACEMENTS[0])
+
+
+def test_token_mismatch_is_not_written(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b'a b\n')
+    changes = {'inserts': [(2, 'x ')], 'removals': [], 'file': None, 'sha1': _blob_hash(b'a b\n'), 'tokens': 6}
+
+    with pytest.raises(ValueError):
+        _process_change(str(tmp_path), "a.txt", "utf-8-sig", False, changes, {}, logging.getLogger("git-repeat"))
+    assert (tmp_path / "a.txt").read_bytes() == b'a b\n'
+
+    _process_change(str(tmp_path), "a.txt", "utf-8-sig", False, dict(changes, tokens=5), {}, logging.getLogger("git-repeat"))
+    assert (tmp_path / "a.txt").read_bytes() == b'a x b\n'
@@ -0,0 +1,44 @@
+import json
+from git import Repo
+from git_repeat.helper import actions
+from git_repeat.helper.differences import compile_path_filter, diff_to_data, update_repository
+from conftest import ENTITY_COMMITS, ENTITY_REPLACEMENTS, ENTITY_REGISTRY, FOO_BAR_COMMITS, RECIPE_VERSION, read_file, read_tree
+
+
+def _two_phase(repo_path, replacements):
+    repo = Repo(repo_path)
+    diffs = repo.commit("HEAD~1").diff(repo.commit("HEAD"))
+    data = diff_to_data(diffs, [], "utf-8-sig", compile_path_filter([], []), RECIPE_VERSION)
+    for r in replacements:
+        update_repository(repo_path, "utf-8-sig", False, r, data)
+
+
+def test_run_matches_two_phase_update(make_repo, json_file):
+    run_path = make_repo("run", *ENTITY_COMMITS)
+    two_phase_path = make_repo("two-phase", *ENTITY_COMMITS)
+
+    actions.run("HEAD~1", "HEAD", run_path, json_file("replacements.json", ENTITY_REPLACEMENTS), "utf-8-sig", "[]", "[]", False, RECIPE_VERSION)
+    _two_phase(two_phase_path, ENTITY_REPLACEMENTS)
+
+    assert read_tree(run_path) == read_tree(two_phase_path)
+    assert read_file(run_path, "src/registry.py") == ENTITY_REGISTRY
+
+
+def test_run_copies_before_changes_on_shared_target(make_repo):
+    run_path = make_repo("run", *FOO_BAR_COMMITS)
+    two_phase_path = make_repo("two-phase", *FOO_BAR_COMMITS)
+
+    actions.run("HEAD~1", "HEAD", run_path, json.dumps({"Foo": "Bar"}), "utf-8-sig", "[]", "[]", False, RECIPE_VERSION)
+    _two_phase(two_phase_path, [{"Foo": "Bar"}])
+
+    assert read_file(run_path, "Bar.txt") == b"hello Bar c\n"
+    assert read_tree(run_path) == read_tree(two_phase_path)
+
+
+def test_run_dry_run_writes_nothing(make_repo):
+    repo_path = make_repo("repo", *ENTITY_COMMITS)
+    before = read_tree(repo_path)
+
+    actions.run("HEAD~1", "HEAD", repo_path, json.dumps(ENTITY_REPLACEMENTS[0]), "utf-8-sig", "[]", "[]", True, RECIPE_VERSION)
+
+    assert read_tree(repo_path) == before